@@ -24,10 +24,20 @@ if sys.version_info < (3,):
 from functools import partial
 from typing import Callable, Union
 
-from .schedulers import schedule
 from .workflow import Job, leafs, roots
 
 
+def __getattr__(name: str):
+    # The schedulers pull in asyncio, cloudpickle, subprocess, ... which
+    # are only needed once a workflow is scheduled, not inside workers.
+    if name in ['schedule', 'iter_schedule']:
+        from . import schedulers
+
+        return getattr(schedulers, name)
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 def after(*deps, status: str = 'success') -> Callable:
     def decorator(self: Job) -> Job:
         self.after(*deps, status=status)
@@ -0,0 +1,135 @@
+r"""Completion journal"""
+
+import os
+import threading
+import time
+
+from pathlib import Path
+
+from .workflow import Job
+
+
+class Journal(object):
+    r"""Append-only journal of completed jobs and array indices.
+
+    Each completion is stored as a compact `name[\tindex[\truntime]]` line,
+    where the runtime (in seconds) is used to plan future runs. Records
+    are buffered and written (and fsynced) in batches, such that the
+    journal does not slow down arrays of small tasks. A background timer
+    flushes the buffer at the latest `interval` seconds after its first
+    record. Records that were not flushed when the process got killed are
+    simply lost, which only means the corresponding tasks are executed
+    again.
+
+    Jobs are identified by their name, which must therefore be unique
+    within a workflow. This is enforced when pruning with a journal.
+
+    Arguments:
+        path: The journal file.
+        batch: The maximum number of buffered records.
+        interval: The maximum time (in seconds) a record stays buffered.
+        readonly: Whether the journal is only read, in which case the file
+            is neither created nor repaired, and nothing can be recorded.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch: int = 1024,
+        interval: float = 1.0,
+        readonly: bool = False,
+    ):
+        super().__init__()
+
+        self.path = Path(path)
+        self.readonly = readonly
+
+        if not readonly:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.batch = batch
+        self.interval = interval
+
+        self.records = set()
+        self.runtimes = {}  # name -> (total, count)
+        self.load()
+        self.buffer = []
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def load(self) -> None:
+        if self.path.exists():
+            with open(self.path, 'rb' if self.readonly else 'rb+') as f:
+                text = f.read()
+                end = text.rfind(b'\n') + 1
+
+                if end < len(text) and not self.readonly:  # discard torn record
+                    f.truncate(end)
+
+            for line in text[:end].decode().splitlines():
+                name, index, runtime, *_ = line.split('\t') + ['', '']
+                self._add(name, int(index) if index else None, float(runtime) if runtime else None)
+
+    def _add(self, name: str, i: int = None, runtime: float = None) -> None:
+        self.records.add((name, i))
+
+        if runtime is not None:
+            total, count = self.runtimes.get(name, (0.0, 0))
+            self.runtimes[name] = (total + runtime, count + 1)
+
+    def record(self, job: Job, i: int = None, runtime: float = None) -> None:
+        assert not self.readonly, 'journal is read-only'
+
+        with self.lock:
+            self._add(job.name, i, runtime)
+            self.buffer.append((job.name, i, runtime))
+
+            if len(self.buffer) >= self.batch or time.monotonic() - self.last >= self.interval:
+                self._flush()
+            elif self.timer is None:  # flush on deadline, even if no record follows
+                self.timer = threading.Timer(self.interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        self.last = time.monotonic()
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        if not self.buffer:
+            return
+
+        text = ''.join(
+            '\t'.join((name, '' if i is None else str(i), '' if t is None else f'{t:.6g}')) + '\n'
+            for name, i, t in self.buffer
+        )
+
+        with open(self.path, 'a') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.buffer.clear()
+
+    def done(self, job: Job, i: int = None) -> bool:
+        if job.array is None:
+            return (job.name, None) in self.records
+        elif i is None:
+            return all((job.name, j) in self.records for j in job.array)
+        else:
+            return (job.name, i) in self.records
+
+    def runtime(self, job: Job) -> float:
+        r"""Returns the mean recorded runtime of the job (per array index),
+        or `None` if it has never been recorded."""
+
+        total, count = self.runtimes.get(job.name, (0.0, 0))
+
+        return total / count if count > 0 else None
@@ -0,0 +1,191 @@
+r"""Workflow planning"""
+
+import heapq
+import os
+
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from .journal import Journal
+from .utils import seconds
+from .workflow import Job, dfs
+
+
+class Plan(object):
+    r"""Execution plan of a (pruned) workflow
+
+    For each pending job, the plan reports the number of pending tasks
+    (array indices), the number of cores per task and the expected
+    runtime per task. The latter is the mean runtime recorded in the
+    journal, if any, and the time limit of the job otherwise.
+
+    Arguments:
+        jobs: The jobs to execute.
+        settings: The scheduler settings, overridden by the job settings.
+        journal: The journal of previous executions.
+        cores: The number of cores available to the workflow, used to
+            simulate its makespan. Defaults to the number of local cores.
+    """
+
+    def __init__(
+        self,
+        *jobs,
+        settings: Dict[str, Any] = {},
+        journal: Journal = None,
+        cores: int = None,
+    ):
+        super().__init__()
+
+        self.jobs = order(*jobs)
+        self.cores = os.cpu_count() if cores is None else cores
+
+        self.pending = {}
+        self.cpus = {}
+        self.timelimits = {}
+        self.runtimes = {}
+
+        for job in self.jobs:
+            merged = settings.copy()
+            merged.update(job.settings)
+
+            timelimit = merged.get('timelimit', merged.get('time'))
+            timelimit = None if timelimit is None else seconds(timelimit)
+
+            runtime = None if journal is None else journal.runtime(job)
+            runtime = timelimit if runtime is None else runtime
+
+            self.pending[job] = 1 if job.array is None else len(job.array)
+            self.cpus[job] = int(merged.get('cpus', 1))
+            self.timelimits[job] = timelimit
+            self.runtimes[job] = runtime
+
+    @property
+    def tasks(self) -> int:
+        return sum(self.pending.values())
+
+    def core_hours(self, limits: bool = False) -> float:
+        r"""Returns the total core-hours of the pending tasks, based on the
+        expected runtimes or, if `limits` is set, on the time limits. Tasks
+        with unknown durations are ignored."""
+
+        durations = self.timelimits if limits else self.runtimes
+
+        return sum(
+            self.pending[job] * self.cpus[job] * durations[job]
+            for job in self.jobs
+            if durations[job] is not None
+        ) / 3600
+
+    def makespan(self) -> float:
+        r"""Simulates the execution of the workflow on `cores` cores, where
+        ready tasks are started greedily in topological order, and returns
+        its duration in seconds. Tasks with unknown durations are instantaneous."""
+
+        cores = self.cores
+
+        children = {job: [] for job in self.jobs}
+        waiting = {}
+
+        for job in self.jobs:
+            deps = [dep for dep in job.dependencies if dep in children]
+
+            for dep in deps:
+                children[dep].append(job)
+
+            if deps and job.waitfor == 'any':
+                waiting[job] = 1
+            else:
+                waiting[job] = len(deps)
+
+        ready = [job for job in self.jobs if waiting[job] == 0]
+        unstarted = self.pending.copy()
+        unfinished = self.pending.copy()
+
+        running = []  # (end, tiebreak, job, cpus)
+        now, free, count = 0.0, cores, 0
+
+        while True:
+            for job in list(ready):
+                cpus = min(self.cpus[job], cores)
+                duration = self.runtimes[job] or 0.0
+
+                while unstarted[job] > 0 and cpus <= free:
+                    heapq.heappush(running, (now + duration, count, job, cpus))
+                    unstarted[job] -= 1
+                    free -= cpus
+                    count += 1
+
+                if unstarted[job] == 0:
+                    ready.remove(job)
+
+            if not running:
+                break
+
+            now, _, job, cpus = heapq.heappop(running)
+            free += cpus
+            unfinished[job] -= 1
+
+            if unfinished[job] == 0:
+                for child in children[job]:
+                    waiting[child] -= 1
+
+                    if waiting[child] == 0:
+                        ready.append(child)
+
+        return now
+
+    def __repr__(self) -> str:
+        def fmt(duration: float) -> str:
+            if duration is None:
+                return '?'
+            elif duration < 60:
+                return f'{duration:.3g}s'
+            else:
+                return str(timedelta(seconds=round(duration)))
+
+        width = max([len(job.name) for job in self.jobs] + [3])
+
+        lines = [f'{"job":<{width}}  {"tasks":>7}  {"cpus":>4}  {"runtime":>14}  {"timelimit":>14}']
+
+        for job in self.jobs:
+            lines.append(
+                f'{job.name:<{width}}  {self.pending[job]:>7}  {self.cpus[job]:>4}  '
+                f'{fmt(self.runtimes[job]):>14}  {fmt(self.timelimits[job]):>14}'
+            )
+
+        lines.extend([
+            '',
+            f'{len(self.jobs)} jobs, {self.tasks} tasks',
+            f'{self.core_hours():.2f} core-hours ({self.core_hours(limits=True):.2f} with time limits)',
+            f'makespan on {self.cores} cores: {fmt(self.makespan())}',
+        ])
+
+        return '\n'.join(lines)
+
+
+def order(*jobs) -> List[Job]:
+    r"""Returns the pending jobs of the workflow in topological order."""
+
+    graph = [job for job in dfs(*jobs, backward=True) if job.f is not None]
+    members = set(graph)
+
+    indegree = {
+        job: sum(dep in members for dep in job.dependencies)
+        for job in graph
+    }
+
+    queue = [job for job in graph if indegree[job] == 0]
+    ordered = []
+
+    while queue:
+        job = queue.pop(0)
+        ordered.append(job)
+
+        for child in job.children:
+            if child in indegree:
+                indegree[child] -= 1
+
+                if indegree[child] == 0:
+                    queue.append(child)
+
+    return ordered
@@ -2,37 +2,167 @@ r"""Scheduling backends"""
 
 import asyncio
 import cloudpickle as pkl
+import math
 import os
 import shutil
+import threading
+import time
+import warnings
 
 from abc import ABC, abstractmethod
+from copy import deepcopy
 from datetime import datetime
+from getpass import getuser
+from inspect import signature
 from pathlib import Path
+from string import Template
 from subprocess import run
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Tuple, Union
 
-from .utils import to_thread
-from .workflow import Job, cycles, prune as _prune
+from . import watch as _watch
+from .journal import Journal
+from .plan import Plan
+from .utils import available_memory, memory, to_thread
+from .workflow import Job, cycles, dfs, prune as _prune
 
 
 def schedule(
     *jobs,
     backend: str = 'local',
     prune: bool = True,
+    watch: bool = False,
+    period: float = 0.5,
+    dry_run: bool = False,
+    cores: int = None,
     **kwargs,
-) -> List[Any]:
+) -> Union[List[Any], Plan]:
+    r"""Schedules the jobs and their dependencies.
+
+    In dry-run mode, nothing is executed nor submitted. Instead, the
+    workflow is checked for cycles and a copy of it is pruned, leaving the
+    jobs untouched, and its `Plan` is returned, with a makespan simulated
+    on `cores` cores. Historical runtimes are read from the journal of the
+    local backend (see `path`). The Slurm backend keeps no journal, so its
+    plans rely on the time limits of the jobs.
+
+    In watch mode, the local backend keeps the workflow in memory after
+    its execution and polls, every `period` seconds, the code of the job
+    functions and the files declared as job `inputs`. When they change,
+    the affected jobs and their descendants are executed again. To apply
+    code changes, the module defining the function is reloaded, which is
+    only possible for importable modules. Changes to functions defined in
+    the `__main__` script, or within other functions, are not applied: they
+    trigger a warning, and the job is not executed again until a restart.
+    This mode never returns.
+    """
+
+    if dry_run:
+        return _plan(*jobs, backend=backend, prune=prune, cores=cores, **kwargs)
+
+    if watch:
+        assert backend == 'local', 'watch mode requires the local backend'
+
+        graph = _watch.snapshot(*jobs)
+
+    scheduler, jobs = _prepare(*jobs, backend=backend, prune=prune, **kwargs)
+
+    if watch:
+        return asyncio.run(_watch.watch(scheduler, graph, jobs, period))
+
+    return asyncio.run(scheduler.gather(*jobs))
+
+
+def iter_schedule(
+    *jobs,
+    backend: str = 'local',
+    prune: bool = True,
+    **kwargs,
+) -> Iterator[Tuple[Job, int, Any]]:
+    r"""Schedules the jobs and yields `(job, index, result)` tuples as soon
+    as each job, or array index, completes. The index is `None` for
+    non-array jobs. Failed tasks yield their exception as result.
+
+    Results are not retained by the scheduler once yielded, which allows
+    to consume large job arrays incrementally.
+    """
+
+    scheduler, jobs = _prepare(*jobs, backend=backend, prune=prune, **kwargs)
+
+    loop = asyncio.new_event_loop()
+    stream = scheduler.stream(*jobs)
+
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(stream.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(stream.aclose())
+
+        tasks = asyncio.all_tasks(loop)
+
+        for task in tasks:
+            task.cancel()
+
+        if tasks:  # gather infers the loop from the tasks
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+        loop.run_until_complete(loop.shutdown_asyncgens())
+
+        if hasattr(loop, 'shutdown_default_executor'):  # Python >= 3.9
+            loop.run_until_complete(loop.shutdown_default_executor())
+
+        loop.close()
+
+
+def _plan(
+    *jobs,
+    backend: str = 'local',
+    prune: bool = True,
+    cores: int = None,
+    **kwargs,
+) -> Plan:
     for cycle in cycles(*jobs, backward=True):
         raise CyclicDependencyGraphError(' <- '.join(map(str, cycle)))
 
+    settings = kwargs.get('settings', {}).copy()
+    journal = None
+
+    if backend == 'local':
+        if kwargs.get('path') is not None:
+            journal = Journal(Path(kwargs['path']) / 'journal', readonly=True)
+    else:  # remaining keyword arguments are settings
+        parameters = signature(SlurmScheduler.__init__).parameters
+        settings.update({
+            key: value for key, value in kwargs.items()
+            if key not in parameters
+        })
+
     if prune:
-        jobs = _prune(*jobs)
+        jobs = _prune(*deepcopy(jobs), journal=journal)
+
+    return Plan(*jobs, settings=settings, journal=journal, cores=cores)
+
+
+def _prepare(
+    *jobs,
+    backend: str = 'local',
+    prune: bool = True,
+    **kwargs,
+) -> Tuple['Scheduler', List[Job]]:
+    for cycle in cycles(*jobs, backward=True):
+        raise CyclicDependencyGraphError(' <- '.join(map(str, cycle)))
 
     scheduler = {
         'local': LocalScheduler,
         'slurm': SlurmScheduler,
     }.get(backend)(**kwargs)
 
-    return asyncio.run(scheduler.gather(*jobs))
+    if prune:
+        jobs = _prune(*jobs, journal=scheduler.journal)
+
+    return scheduler, jobs
 
 
 class Scheduler(ABC):
@@ -40,9 +170,42 @@ class Scheduler(ABC):
 
     def __init__(self, **kwargs):
         self.submissions = {}
+        self.journal = None
+        self.results = None
 
     async def gather(self, *jobs) -> List[Any]:
-        return await asyncio.gather(*map(self.submit, jobs))
+        try:
+            return await asyncio.gather(*map(self.submit, jobs))
+        finally:
+            if self.journal is not None:
+                self.journal.flush()
+
+    async def stream(self, *jobs) -> AsyncIterator[Tuple[Job, int, Any]]:
+        self.results = asyncio.Queue()
+
+        task = asyncio.ensure_future(self.gather(*jobs))
+
+        try:
+            while not task.done():
+                get = asyncio.ensure_future(self.results.get())
+
+                await asyncio.wait({get, task}, return_when=asyncio.FIRST_COMPLETED)
+
+                if get.done():
+                    yield get.result()
+                else:
+                    get.cancel()
+
+            while not self.results.empty():
+                yield self.results.get_nowait()
+
+            task.result()
+        finally:
+            task.cancel()
+
+    def emit(self, job: Job, i: int, result: Any) -> None:
+        if self.results is not None:
+            self.results.put_nowait((job, i, result))
 
     async def submit(self, job: Job) -> Any:
         if job not in self.submissions:
@@ -56,7 +219,102 @@ class Scheduler(ABC):
 
 
 class LocalScheduler(Scheduler):
-    r"""Local scheduler"""
+    r"""Local scheduler
+
+    Arguments:
+        headroom: The amount of available system memory below which the
+            execution of new jobs (or array indices) is paused, either in
+            bytes, as a fraction of the total memory or as a string such
+            as '4GB'. Execution resumes when memory frees. At least one job
+            is always allowed to run. If `None`, memory is not monitored.
+        interval: The memory sampling interval (in seconds) while paused.
+            The concurrency is also increased by at most one job every
+            `interval` seconds, such that the memory of newly admitted jobs
+            is observed before admitting more. Slots freed by completed
+            jobs are reused immediately, as long as memory allows it.
+        path: The scheduler directory. If specified, completed jobs and
+            array indices are recorded in a journal within this directory,
+            which is consulted when pruning such that a subsequent run
+            resumes where the previous one stopped, even for jobs without
+            postconditions. Jobs are identified by name, which must be
+            unique within the workflow.
+        grain: The targeted duration (in seconds) of the chunks of array
+            indices dispatched to a thread. The chunk sizes are adapted to
+            the runtimes measured while the array executes.
+    """
+
+    def __init__(
+        self,
+        headroom: Union[int, float, str] = None,
+        interval: float = 0.5,
+        path: str = None,
+        grain: float = 0.01,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+
+        # Array chunking
+        self.grain = grain
+        self.workers = min(32, (os.cpu_count() or 1) + 4)  # default executor
+
+        # Journal
+        if path is not None:
+            self.journal = Journal(Path(path) / 'journal')
+
+        # Memory throttling
+        self.headroom = None if headroom is None else memory(headroom)
+        self.interval = interval
+
+        self.running = 0
+        self.limit = 1  # admitted concurrency
+        self.grown = 0.0  # time of the last increase
+        self.lock = threading.Lock()
+
+    def admit(self) -> None:
+        r"""Blocks the calling thread until there is enough memory headroom."""
+
+        while True:
+            with self.lock:
+                if self.headroom is None:
+                    admitted = True
+                elif self.running == 0:
+                    admitted = True
+                    self.grown = time.monotonic()
+                elif available_memory() < self.headroom:
+                    admitted = False
+                    self.limit = self.running
+                elif self.running < self.limit:
+                    admitted = True
+                elif time.monotonic() - self.grown >= self.interval:
+                    admitted = True
+                    self.limit += 1
+                    self.grown = time.monotonic()
+                else:
+                    admitted = False
+
+                if admitted:
+                    self.running += 1
+                    return
+
+            time.sleep(self.interval)
+
+    def release(self) -> None:
+        with self.lock:
+            self.running -= 1
+
+    def run(self, f: Callable, *args) -> Tuple[Any, float]:
+        r"""Executes `f` in the calling thread and returns its result, as well
+        as the elapsed time."""
+
+        self.admit()
+
+        try:
+            start = time.perf_counter()
+            result = f(*args)
+
+            return result, time.perf_counter() - start
+        finally:
+            self.release()
 
     async def condition(self, job: Job, status: str) -> Any:
         result = await self.submit(job)
@@ -72,6 +330,102 @@ class LocalScheduler(Scheduler):
             else:
                 return result
 
+    def chunk(self, fn: Callable, indices: List[int]) -> Tuple[List[Tuple[Any, bool]], float]:
+        r"""Executes a chunk of array indices in the calling thread and
+        returns the `(result, failed)` outcomes, as well as the elapsed time."""
+
+        self.admit()
+
+        try:
+            outcomes = []
+            start = time.perf_counter()
+
+            for i in indices:
+                try:
+                    outcomes.append((fn(i), False))
+                except Exception as error:
+                    outcomes.append((error, True))
+
+            return outcomes, time.perf_counter() - start
+        finally:
+            self.release()
+
+    def chunksize(self, remaining: int, runtime: float = None) -> int:
+        r"""Guided self-scheduling: a chunk is a share of the remaining
+        indices, capped such that it lasts about `grain` seconds given the
+        measured runtime per index."""
+
+        if runtime is None:
+            return 1
+
+        guided = math.ceil(remaining / self.workers)
+        target = int(self.grain / max(runtime, 1e-9))
+
+        return max(1, min(guided, target))
+
+    def complete(self, job: Job, i: int, result: Any, runtime: float = None) -> Any:
+        if self.journal is not None:
+            self.journal.record(job, i, runtime)
+
+        if self.results is not None:  # streamed, not retained
+            self.emit(job, i, result)
+            result = None
+
+        return result
+
+    async def execute(self, job: Job, fn: Callable) -> Any:
+        try:
+            result, runtime = await to_thread(self.run, fn)
+        except Exception as error:
+            self.emit(job, None, error)
+            raise
+
+        return self.complete(job, None, result, runtime)
+
+    async def execute_array(self, job: Job, fn: Callable) -> List[Any]:
+        indices = list(job.array)
+        results = [None] * len(indices)
+        failures = []
+
+        position = 0
+        pending = {}
+        elapsed, count = 0.0, 0
+
+        while position < len(indices) or pending:
+            # Dispatch chunks, adapted to the runtimes measured so far
+            while position < len(indices) and len(pending) < self.workers:
+                runtime = elapsed / count if count > 0 else None
+                size = self.chunksize(len(indices) - position, runtime)
+
+                task = asyncio.ensure_future(
+                    to_thread(self.chunk, fn, indices[position:position + size])
+                )
+
+                pending[task] = position
+                position += size
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                start = pending.pop(task)
+                outcomes, duration = task.result()
+
+                elapsed += duration
+                count += len(outcomes)
+
+                for k, (result, failed) in enumerate(outcomes, start):
+                    if failed:
+                        self.emit(job, indices[k], result)
+                        results[k] = result
+                        failures.append(k)
+                    else:
+                        results[k] = self.complete(job, indices[k], result, duration / len(outcomes))
+
+        if failures:  # the error of the first failed index
+            raise results[min(failures)]
+
+        return results
+
     async def _submit(self, job: Job) -> Any:
         # Wait for (all or any) dependencies to complete
         pending = {
@@ -101,18 +455,30 @@ class LocalScheduler(Scheduler):
         # Execute job
         try:
             if job.array is None:
-                return await to_thread(job.fn)
+                return await self.execute(job, job.fn)
             else:
-                return await asyncio.gather(*(
-                    to_thread(job.fn, i)
-                    for i in job.array
-                ))
+                return await self.execute_array(job, job.fn)
         except Exception as error:
             return error
+        finally:  # persist the records before dependents start
+            if self.journal is not None:
+                await to_thread(self.journal.flush)
 
 
 class SlurmScheduler(Scheduler):
-    r"""Slurm scheduler"""
+    r"""Slurm scheduler
+
+    Arguments:
+        max_running: The default maximum number of simultaneously running
+            tasks of a job array, rendered as a Slurm array throttle (`%N`).
+            Jobs can override it with their own `max_running` setting.
+        max_submitted: The maximum number of outstanding (pending or running)
+            tasks submitted by the scheduler. Further submissions are queued
+            until earlier tasks finish, which is checked every `interval`
+            seconds with `squeue`. A job is always submitted when no task
+            is outstanding, even if its array exceeds this limit.
+        interval: The polling interval (in seconds) of queued submissions.
+    """
 
     def __init__(
         self,
@@ -121,6 +487,9 @@ class SlurmScheduler(Scheduler):
         shell: str = None,
         env: List[str] = [],  # cd, virtualenv, conda, etc.
         settings: Dict[str, Any] = {},
+        max_running: int = None,
+        max_submitted: int = None,
+        interval: float = 30.0,
         **kwargs,
     ):
         super().__init__()
@@ -151,6 +520,25 @@ class SlurmScheduler(Scheduler):
             'timelimit': 'time',
         }
 
+        self.minimal = {  # for empty (pruned) jobs
+            'cpus': 1,
+            'timelimit': '1:00',
+        }
+
+        # Throttling
+        self.max_running = max_running
+        self.max_submitted = max_submitted
+        self.interval = interval
+
+        self.outstanding = {}  # jobid -> number of tasks
+        self.gate = None
+
+        # Templates and payloads
+        self.templates = {}
+        self.payloads = self.path / 'payloads.pkl'
+        self.offsets = {}
+        self.scripts = self.path / 'scripts'
+
         # Identifier table
         self.table = {}
 
@@ -164,6 +552,108 @@ class SlurmScheduler(Scheduler):
 
         return identifier
 
+    def refresh(self) -> None:
+        r"""Forgets the outstanding jobs that are no longer in the queue.
+
+        If `squeue` fails, the outstanding jobs are kept as is, and the
+        queue is checked again at the next poll.
+        """
+
+        process = run(
+            ['squeue', '--noheader', '--array', f'--user={getuser()}', '--format=%F'],
+            capture_output=True, text=True,
+        )
+
+        if process.returncode != 0:
+            warnings.warn(f'squeue failed ({process.stderr.strip()}), retrying in {self.interval}s')
+            return
+
+        queued = {}
+
+        for jobid in process.stdout.split():
+            queued[jobid] = queued.get(jobid, 0) + 1
+
+        self.outstanding = {
+            jobid: queued[jobid]
+            for jobid in self.outstanding
+            if jobid in queued
+        }
+
+    async def throttle(self, tasks: int) -> None:
+        r"""Waits until `tasks` more tasks can be submitted."""
+
+        while (
+            self.max_submitted is not None
+            and self.outstanding
+            and sum(self.outstanding.values()) + tasks > self.max_submitted
+        ):
+            await asyncio.sleep(self.interval)
+            await to_thread(self.refresh)
+
+    async def gather(self, *jobs) -> List[Any]:
+        self.pack(*jobs)
+
+        return await super().gather(*jobs)
+
+    def pack(self, *jobs) -> None:
+        r"""Pickles the functions of all jobs, at once, in a single payload
+        file. Workers seek their function by offset within this file."""
+
+        with open(self.payloads, 'ab') as f:
+            for job in dfs(*jobs, backward=True):
+                if job.empty or job in self.offsets:
+                    continue
+
+                self.offsets[job] = f.tell()
+                f.write(pkl.dumps(job.fn))
+
+            f.flush()
+            os.fsync(f.fileno())
+
+    def template(self, settings: Dict[str, Any], env: List[str]) -> Template:
+        r"""Returns the (cached) submission script template of a combination
+        of settings and environment."""
+
+        key = repr((settings, env))
+
+        if key not in self.templates:
+            escape = lambda line: line.replace('$', '$$')
+
+            lines = [
+                escape(f'#!{self.shell}'),
+                '#',
+                '#SBATCH --job-name=${name}',
+                '${array}#SBATCH --output=${logfile}',
+                '#',
+            ]
+
+            for k, value in settings.items():
+                k = self.translate.get(k, k)
+
+                if value is None:
+                    lines.append(escape(f'#SBATCH --{k}'))
+                else:
+                    lines.append(escape(f'#SBATCH --{k}={value}'))
+
+            if settings:
+                lines.append('#')
+
+            lines.extend([
+                '${dependency}#SBATCH --export=ALL',
+                '#SBATCH --parsable',
+                '#SBATCH --requeue',
+                '',
+            ])
+
+            if env:
+                lines.extend([*map(escape, env), ''])
+
+            lines.extend(['${command}', ''])
+
+            self.templates[key] = Template('\n'.join(lines))
+
+        return self.templates[key]
+
     async def _submit(self, job: Job) -> str:
         # Wait for dependencies to be submitted
         jobids = await asyncio.gather(*[
@@ -171,27 +661,6 @@ class SlurmScheduler(Scheduler):
             for dep in job.dependencies
         ])
 
-        # Write submission file
-        lines = [
-            f'#!{self.shell}',
-            '#',
-            f'#SBATCH --job-name={job.name}',
-        ]
-
-        if job.array is None or job.empty:
-            logfile = self.path / f'{self.id(job)}_%j.log'
-        else:
-            array = job.array
-
-            if type(array) is range:
-                lines.append('#SBATCH --array=' + f'{array.start}-{array.stop-1}:{array.step}')
-            else:
-                lines.append('#SBATCH --array=' + ','.join(map(str, array)))
-
-            logfile = self.path / f'{self.id(job)}_%j_%a.log'
-
-        lines.extend([f'#SBATCH --output={logfile}', '#'])
-
         ## Settings
         settings = self.settings.copy()
         settings.update(job.settings)
@@ -199,16 +668,26 @@ class SlurmScheduler(Scheduler):
         if job.empty:
             settings.update(self.minimal)
 
-        for key, value in settings.items():
-            key = self.translate.get(key, key)
+        max_running = settings.pop('max_running', self.max_running)
+        settings.pop('max_submitted', None)
+
+        ## Array
+        if job.array is None or job.empty:
+            array = ''
+            logfile = self.path / f'{self.id(job)}_%j.log'
+        else:
+            array = job.array
 
-            if value is None:
-                lines.append(f'#SBATCH --{key}')
+            if type(array) is range:
+                array = f'{array.start}-{array.stop-1}:{array.step}'
             else:
-                lines.append(f'#SBATCH --{key}={value}')
+                array = ','.join(map(str, array))
 
-        if settings:
-            lines.append('#')
+            if max_running is not None:
+                array += f'%{max_running}'
+
+            array = f'#SBATCH --array={array}\n'
+            logfile = self.path / f'{self.id(job)}_%j_%a.log'
 
         ## Dependencies
         separator = '?' if job.waitfor == 'any' else ','
@@ -224,42 +703,46 @@ class SlurmScheduler(Scheduler):
         ]
 
         if deps:
-            lines.extend(['#SBATCH --dependency=' + separator.join(deps), '#'])
-
-        ## Convenience
-        lines.extend([
-            '#SBATCH --export=ALL',
-            '#SBATCH --parsable',
-            '#SBATCH --requeue',
-            '',
-        ])
+            dependency = '#SBATCH --dependency=' + separator.join(deps) + '\n#\n'
+        else:
+            dependency = ''
+
+        ## Command
+        if job.empty:
+            command = 'true'
+        else:
+            args = '' if job.array is None else ' $SLURM_ARRAY_TASK_ID'
+            command = f'python -m awflow.worker "{self.payloads}@{self.offsets[job]}"{args}'
 
-        ## Environment
-        if job.env:
-            lines.extend([*job.env, ''])
-        elif self.env:
-            lines.extend([*self.env, ''])
+        ## Script
+        script = self.template(settings, job.env or self.env).substitute(
+            name=job.name,
+            array=array,
+            logfile=logfile,
+            dependency=dependency,
+            command=command,
+        )
 
-        ## Pickle function
-        pklfile = self.path / f'{self.id(job)}.pkl'
+        # Submit job (script through stdin), once the number of outstanding tasks allows it
+        tasks = 1 if job.array is None or job.empty else len(job.array)
 
-        with open(pklfile, 'wb') as f:
-            f.write(pkl.dumps(job.fn))
+        if self.gate is None:  # bound to the running event loop
+            self.gate = asyncio.Lock()
 
-        args = '' if job.array is None else '$SLURM_ARRAY_TASK_ID'
-        unpickle = f'python -c "import pickle; pickle.load(open(r\'{pklfile}\', \'rb\'))({args})"'
+        async with self.gate:
+            await self.throttle(tasks)
 
-        lines.extend([unpickle, ''])
+            text = run(['sbatch'], input=script, capture_output=True, check=True, text=True).stdout
+            jobid, *_ = text.splitlines()
+            jobid = jobid.split(';')[0]  # jobid[;cluster]
 
-        ## Save
-        bashfile = self.path / f'{self.id(job)}.sh'
+            self.outstanding[jobid] = tasks
 
-        with open(bashfile, 'w') as f:
-            f.write('\n'.join(lines))
+        # Archive the submitted script
+        with open(self.scripts, 'a') as f:
+            f.write(f'### {self.id(job)} ({jobid})\n{script}\n')
 
-        # Submit job
-        text = run(['sbatch', str(bashfile)], capture_output=True, check=True, text=True).stdout
-        jobid, *_ = text.splitlines()
+        self.emit(job, None, jobid)
 
         return jobid
 
@@ -1,11 +1,10 @@
 r"""Miscellaneous helpers"""
 
-import asyncio
-import contextvars
+import os
+import re
 
 from functools import partial
-from inspect import signature
-from typing import Any, Callable
+from typing import Any, Callable, Union
 
 
 async def to_thread(f: Callable, /, *args, **kwargs) -> Any:
@@ -22,6 +21,9 @@ async def to_thread(f: Callable, /, *args, **kwargs) -> Any:
         https://github.com/python/cpython/blob/main/Lib/asyncio/threads.py
     """
 
+    import asyncio
+    import contextvars
+
     loop = asyncio.get_running_loop()
     ctx = contextvars.copy_context()
     func_call = partial(ctx.run, f, *args, **kwargs)
@@ -33,9 +35,92 @@ def accepts(f: Callable, *args, **kwargs) -> bool:
     r"""Checks whether function `f` accepts the supplied
     *args and **kwargs without errors."""
 
+    from inspect import signature
+
     try:
         signature(f).bind(*args, **kwargs)
     except TypeError as e:
         return False
     else:
         return True
+
+
+def memory(size: Union[int, float, str]) -> int:
+    r"""Converts a memory size to a number of bytes.
+
+    The size is either a number of bytes, a fraction (in ]0, 1[) of the
+    total physical memory, or a string with a binary unit suffix, such as
+    '512M' or '4GB'.
+    """
+
+    if isinstance(size, str):
+        units = {'': 0, 'K': 1, 'M': 2, 'G': 3, 'T': 4}
+        match = re.fullmatch(r'\s*([\d.]+)\s*([KMGT]?)B?\s*', size.upper())
+
+        assert match is not None, f'invalid memory size {size!r}'
+
+        value, unit = match.groups()
+
+        return int(float(value) * 1024 ** units[unit])
+    elif isinstance(size, float) and 0 < size < 1:
+        return int(size * total_memory())
+    else:
+        return int(size)
+
+
+def total_memory() -> int:
+    r"""Returns the total physical memory of the system, in bytes."""
+
+    return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+def available_memory() -> int:
+    r"""Returns the memory available to new processes, in bytes.
+
+    `psutil` is used when it is installed. Otherwise, the estimate is read
+    from `/proc/meminfo` and, as a last resort, the number of free pages
+    is reported.
+    """
+
+    try:
+        import psutil
+    except ImportError:
+        pass
+    else:
+        return psutil.virtual_memory().available
+
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+def seconds(timelimit: Union[int, str]) -> int:
+    r"""Converts a Slurm time limit to a number of seconds.
+
+    Accepted formats are 'minutes', 'minutes:seconds', 'hours:minutes:seconds',
+    'days-hours', 'days-hours:minutes' and 'days-hours:minutes:seconds'.
+    """
+
+    if not isinstance(timelimit, str):
+        return int(timelimit) * 60
+
+    days, _, clock = timelimit.strip().rpartition('-')
+    fields = list(map(int, clock.split(':')))
+
+    if days:
+        fields += [0] * (3 - len(fields))  # days-hours[:minutes[:seconds]]
+        hours, minutes, secs = fields
+    elif len(fields) == 1:
+        hours, minutes, secs = 0, fields[0], 0
+    elif len(fields) == 2:
+        hours, minutes, secs = 0, *fields
+    else:
+        hours, minutes, secs = fields
+
+    return ((int(days or 0) * 24 + hours) * 60 + minutes) * 60 + secs
@@ -0,0 +1,174 @@
+r"""Incremental re-execution on input changes"""
+
+import asyncio
+import glob
+import importlib
+import inspect
+import linecache
+import os
+import sys
+import warnings
+
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+from .workflow import Job, dfs
+
+
+Snapshot = Dict[Job, Tuple[Callable, Any, Dict[Job, str]]]
+
+
+def snapshot(*jobs) -> Snapshot:
+    r"""Records the function, array and dependencies of every job in the
+    workflow, such that they can be restored after pruning."""
+
+    return {
+        job: (job.f, job.array, dict(job.dependencies))
+        for job in dfs(*jobs, backward=True)
+    }
+
+
+def fingerprint(job: Job, f: Callable) -> Hashable:
+    r"""Summarizes the source code of `f` and the modification times of the
+    job's inputs."""
+
+    try:
+        linecache.checkcache(f.__code__.co_filename)
+        code = inspect.getsource(f)
+    except (AttributeError, OSError, TypeError):
+        code = None
+
+    files = []
+
+    for pattern in job.inputs:
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            files.append((path, stat.st_mtime_ns, stat.st_size))
+
+    return code, tuple(files)
+
+
+def latest(f: Callable) -> Callable:
+    r"""Reloads the module of `f` and returns the new definition of `f`.
+
+    Returns `None` if `f` cannot be resolved after reloading, which is the
+    case for functions defined in `__main__` or within other functions.
+    """
+
+    module = sys.modules.get(f.__module__)
+
+    if module is None or module.__name__ == '__main__' or '<locals>' in f.__qualname__:
+        return None
+
+    try:
+        obj = importlib.reload(module)
+
+        for attr in f.__qualname__.split('.'):
+            obj = getattr(obj, attr)
+    except Exception:
+        return None
+
+    if isinstance(obj, Job):
+        obj = obj.f
+
+    return obj if callable(obj) else None
+
+
+async def watch(
+    scheduler: 'Scheduler',
+    graph: Snapshot,
+    jobs: List[Job],
+    period: float = 0.5,
+) -> None:
+    r"""Executes the (pruned) jobs, then polls the workflow for changes
+    every `period` seconds and re-executes the jobs that changed, as well
+    as their descendants. Jobs whose code changed but cannot be reloaded
+    are not re-executed, and a warning is issued instead. Never returns."""
+
+    functions = {job: f for job, (f, _, _) in graph.items()}
+    fingerprints = {job: fingerprint(job, functions[job]) for job in graph}
+
+    children = {job: [] for job in graph}
+
+    for job, (_, _, parents) in graph.items():
+        for dep in parents:
+            children[dep].append(job)
+
+    await _gather(scheduler, *jobs)
+
+    while True:
+        await asyncio.sleep(period)
+
+        changed = []
+
+        for job in graph:
+            current = fingerprint(job, functions[job])
+
+            if current == fingerprints[job]:
+                continue
+
+            if current[0] != fingerprints[job][0]:
+                f = latest(functions[job])
+
+                if f is None:  # re-executing the old code would be misleading
+                    warnings.warn(f'the code of job {job} changed, but cannot be reloaded; restart to apply it')
+                    continue
+
+                functions[job] = f
+                current = fingerprint(job, f)
+
+            fingerprints[job] = current
+            changed.append(job)
+
+        if not changed:
+            continue
+
+        # Invalidate changed jobs and their descendants
+        affected = set()
+        queue = changed
+
+        while queue:
+            job = queue.pop()
+
+            if job not in affected:
+                affected.add(job)
+                queue.extend(children[job])
+
+        # Unaffected jobs keep their previous outcome, such that failed or
+        # aborted dependencies still block (or trigger) their dependents
+        submissions = {
+            job: task for job, task in scheduler.submissions.items()
+            if job not in affected
+        }
+
+        for job in affected:
+            _, array, parents = graph[job]
+
+            job.f = functions[job]
+            job.array = array
+            job.detach(*job.dependencies)
+
+            satisfied = False
+
+            for dep, status in parents.items():
+                if dep in affected or dep in submissions:
+                    job.after(dep, status=status)
+                else:  # completed before watching, see prune
+                    satisfied = True
+
+            if satisfied and job.waitfor == 'any':
+                job.detach(*job.dependencies)
+
+        scheduler.submissions = submissions
+
+        await _gather(scheduler, *affected)
+
+
+async def _gather(scheduler: 'Scheduler', *jobs) -> None:
+    try:
+        await scheduler.gather(*jobs)
+    except Exception as error:  # keep watching
+        warnings.warn(f'{type(error).__name__}: {error}')
@@ -0,0 +1,41 @@
+r"""Minimal worker entry point
+
+Executes a pickled job function, optionally for a single array index.
+
+    python -m awflow.worker <payload>[@offset] [index]
+
+The offset locates the function within a file packing the payloads of
+several jobs.
+
+This module is kept deliberately small and imports nothing beyond `pickle`
+and `sys` by itself, on top of the (lightweight) `awflow` package. However,
+unpickling the payload imports `cloudpickle`, with which it was written,
+as well as the modules the job function refers to.
+"""
+
+import pickle
+import sys
+
+
+def load(path: str):
+    r"""Unpickles the job function stored at `path`, or at `offset` bytes
+    within the file if `path` has the form `file@offset`."""
+
+    file, at, offset = path.rpartition('@')
+
+    if not at or not offset.isdigit():
+        file, offset = path, 0
+
+    with open(file, 'rb') as f:
+        f.seek(int(offset))
+
+        return pickle.load(f)
+
+
+def main(path: str, *args) -> None:
+    fn = load(path)
+    fn(*map(int, args))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -55,6 +55,7 @@ class Job(Node):
         name: str = None,
         array: Union[int, Set[int], range] = None,
         env: List[str] = [],
+        inputs: List[str] = [],
         settings: Dict[str, Any] = {},
         **kwargs,
     ):
@@ -76,6 +77,9 @@ class Job(Node):
         # Environment
         self.env = env
 
+        # Inputs (paths or glob patterns)
+        self.inputs = inputs
+
         # Settings
         self.settings = settings.copy()
         self.settings.update(kwargs)
@@ -98,13 +102,18 @@ class Job(Node):
         return reducer
 
     def _reducer_preconditions(self) -> Callable:
-        preconditions = self.preconditions
+        # Resolve signatures now, such that the (pickled) reducer does
+        # not depend on awflow or inspect at execution time.
+        preconditions = [
+            (c, accepts(c, 0))
+            for c in self.preconditions
+        ]
 
         def reducer(*args):
             satisfied = True
 
-            for c in preconditions:
-                if accepts(c, 0):
+            for c, indexed in preconditions:
+                if indexed:
                     satisfied &= c(*args)
                 else:
                     satisfied &= c()
@@ -129,6 +138,10 @@ class Job(Node):
 
         return call
 
+    @property
+    def empty(self) -> bool:
+        return self.f is None
+
     def __call__(self, *args) -> Any:
         return self.fn(*args)
 
@@ -257,15 +270,27 @@ def cycles(*nodes, backward: bool = False) -> Iterator[List[Node]]:
         visited.add(node)
 
 
-def prune(*jobs) -> List[Job]:
+def prune(*jobs, journal: 'Journal' = None) -> List[Job]:
+    if journal is None:
+        completed = lambda job, *i: job.done(*i)
+    else:  # the journal is consulted before the postconditions
+        completed = lambda job, *i: journal.done(job, *i) or job.done(*i)
+
+        # The journal identifies jobs by name
+        names = set()
+
+        for job in dfs(*jobs, backward=True):
+            assert job.name not in names, f'job name {job.name} is not unique, which a journal requires'
+            names.add(job.name)
+
     for job in dfs(*jobs, backward=True):
-        if job.done():
+        if completed(job):
             job.f = None
             job.detach(*job.dependencies)
         elif job.array is not None:
             pending = {
                 i for i in job.array
-                if not job.done(i)
+                if not completed(job, i)
             }
 
             if len(pending) < len(job.array):
@@ -276,7 +301,7 @@ def prune(*jobs) -> List[Job]:
 
         done = {
             dep for dep, status in job.dependencies.items()
-            if dep.done() and status != 'failure'
+            if completed(dep) and status != 'failure'
         }
 
         if job.waitfor == 'any' and done:
@@ -286,5 +311,5 @@ def prune(*jobs) -> List[Job]:
 
     return [
         job for job in jobs
-        if not job.done()
+        if not completed(job)
     ]
@@ -0,0 +1,49 @@
+r"""Import-time benchmark
+
+Measures the wall-clock time of `import awflow` and of bootstrapping a
+worker (`python -m awflow.worker`) for a trivial job, which bounds the
+per-task overhead of large job arrays.
+"""
+
+import argparse
+import cloudpickle as pkl
+import subprocess
+import sys
+import tempfile
+import time
+
+from awflow import job
+
+
+parser = argparse.ArgumentParser('awflow import-time benchmark.')
+parser.add_argument('--repeat', type=int, default=20, help='Number of interpreter launches per measurement (default: 20).')
+arguments, _ = parser.parse_known_args()
+
+
+def measure(*args) -> float:
+    timings = []
+
+    for _ in range(arguments.repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], check=True)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+@job(array=1)
+def noop(i: int):
+    pass
+
+
+with tempfile.NamedTemporaryFile(suffix='.pkl') as f:
+    f.write(pkl.dumps(noop.fn))
+    f.flush()
+
+    baseline = measure('-c', 'pass')
+    package = measure('-c', 'import awflow')
+    worker = measure('-m', 'awflow.worker', f.name, '0')
+
+print(f'python          {baseline * 1e3:7.1f} ms')
+print(f'import awflow   {package * 1e3:7.1f} ms (+{(package - baseline) * 1e3:.1f} ms)')
+print(f'awflow.worker   {worker * 1e3:7.1f} ms (+{(worker - baseline) * 1e3:.1f} ms)')
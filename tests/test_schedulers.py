@@ -0,0 +1,301 @@
+import asyncio
+import awflow.schedulers as schedulers
+import awflow.watch as watch
+import os
+import pytest
+import subprocess
+import sys
+import threading
+import time
+
+from awflow import after, ensure, iter_schedule, job, schedule
+
+
+def concurrency(monkeypatch, available: int, **kwargs) -> int:
+    monkeypatch.setattr(schedulers, 'available_memory', lambda: available)
+
+    lock = threading.Lock()
+    state = {'running': 0, 'peak': 0}
+
+    @job(array=4)
+    def task(i: int):
+        with lock:
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+
+        time.sleep(0.2)
+
+        with lock:
+            state['running'] -= 1
+
+    schedule(task, prune=False, grain=0.0, **kwargs)
+
+    return state['peak']
+
+
+def test_admission_under_pressure(monkeypatch):
+    assert concurrency(monkeypatch, available=2**20, headroom='1GB', interval=0.01) == 1
+
+
+def test_admission_is_spaced(monkeypatch):
+    assert concurrency(monkeypatch, available=2**40, headroom='1GB', interval=1.0) == 1
+    assert concurrency(monkeypatch, available=2**40, headroom='1GB', interval=0.05) > 1
+
+
+def test_journal_requires_unique_names(tmp_path):
+    jobs = []
+
+    for _ in range(4):
+        @job(name='fit')
+        def fit():
+            pass
+
+        jobs.append(fit)
+
+    with pytest.raises(AssertionError):
+        schedule(*jobs, path=tmp_path)
+
+
+def test_iter_schedule_keeps_event_loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    @job(array=3)
+    def square(i: int):
+        return i * i
+
+    try:
+        results = {i: result for _, i, result in iter_schedule(square, prune=False)}
+
+        assert results == {0: 0, 1: 1, 2: 4}
+        assert asyncio.get_event_loop() is loop
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def test_dry_run_leaves_workflow_untouched(tmp_path):
+    @ensure(lambda i: i < 5)
+    @job(array=10, timelimit='1:00:00')
+    def a(i: int):
+        pass
+
+    @after(a)
+    @job
+    def b():
+        pass
+
+    plan = schedule(b, dry_run=True, cores=1, path=tmp_path / 'awflow')
+
+    assert plan.tasks == 6
+    assert plan.makespan() == 5 * 3600
+    assert a.array == range(10) and a.f is not None
+    assert b.dependencies == {a: 'success'}
+    assert not (tmp_path / 'awflow').exists()
+
+
+def test_refresh_keeps_outstanding_on_failure(monkeypatch):
+    scheduler = schedulers.SlurmScheduler.__new__(schedulers.SlurmScheduler)
+    scheduler.interval = 0.0
+    scheduler.outstanding = {'101': 2, '102': 1}
+
+    failure = subprocess.CompletedProcess([], 1, stdout='', stderr='error')
+    monkeypatch.setattr(schedulers, 'run', lambda *args, **kwargs: failure)
+
+    with pytest.warns(UserWarning):
+        scheduler.refresh()
+
+    assert scheduler.outstanding == {'101': 2, '102': 1}
+
+    success = subprocess.CompletedProcess([], 0, stdout='101\n', stderr='')
+    monkeypatch.setattr(schedulers, 'run', lambda *args, **kwargs: success)
+
+    scheduler.refresh()
+
+    assert scheduler.outstanding == {'101': 1}
+
+
+def test_journal_survives_kill(tmp_path):
+    script = tmp_path / 'workflow.py'
+    script.write_text(
+        'import time\n'
+        'from awflow import after, job, schedule\n'
+        '\n'
+        '@job(array=50)\n'
+        'def fast(i):\n'
+        '    pass\n'
+        '\n'
+        '@after(fast)\n'
+        '@job\n'
+        'def slow():\n'
+        '    time.sleep(60)\n'
+        '\n'
+        f'schedule(slow, path={str(tmp_path / "awflow")!r})\n'
+    )
+
+    journal = tmp_path / 'awflow' / 'journal'
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    process = subprocess.Popen([sys.executable, str(script)], env=env)
+
+    try:
+        for _ in range(100):
+            if journal.exists() and len(journal.read_text().splitlines()) == 50:
+                break
+
+            time.sleep(0.1)
+
+        assert process.poll() is None  # killed mid-workflow
+    finally:
+        process.kill()
+        process.wait()
+
+    records = {tuple(line.split('\t')[:2]) for line in journal.read_text().splitlines()}
+
+    assert records == {('fast', str(i)) for i in range(50)}
+
+
+def test_chunksize_adapts_to_runtime():
+    scheduler = schedulers.LocalScheduler(grain=0.01)
+    scheduler.workers = 8
+
+    assert scheduler.chunksize(10000) == 1
+    assert scheduler.chunksize(10000, runtime=1e-6) == 1250
+    assert scheduler.chunksize(80, runtime=1e-6) == 10
+    assert scheduler.chunksize(10000, runtime=1.0) == 1
+
+
+def test_execute_array_in_chunks():
+    scheduler = schedulers.LocalScheduler(grain=1.0)
+    sizes = []
+    chunk = scheduler.chunk
+
+    def spy(fn, indices):
+        sizes.append(len(indices))
+        return chunk(fn, indices)
+
+    scheduler.chunk = spy
+
+    @job(array=range(1000, 0, -1))
+    def square(i: int):
+        return i * i
+
+    assert asyncio.run(scheduler.execute_array(square, square.fn)) == [i * i for i in range(1000, 0, -1)]
+    assert max(sizes) > 1
+
+    @job(array=1000)
+    def fail(i: int):
+        if i % 100 == 42:
+            raise ValueError(i)
+
+    sizes.clear()
+
+    with pytest.raises(ValueError) as error:
+        asyncio.run(scheduler.execute_array(fail, fail.fn))
+
+    assert error.value.args == (42,)
+    assert max(sizes) > 1
+
+
+def test_watch_keeps_unsatisfied_dependencies(tmp_path, monkeypatch):
+    log = tmp_path / 'log'
+    source = (
+        'from awflow import after, job\n'
+        '\n'
+        '@job\n'
+        'def a():\n'
+        '    raise ValueError()\n'
+        '\n'
+        '@after(a)\n'
+        '@job\n'
+        'def b():\n'
+        f'    open({str(log)!r}, "a").write("b {{version}}\\n")\n'
+        '\n'
+        '@after(a, status="failure")\n'
+        '@job\n'
+        'def c():\n'
+        f'    open({str(log)!r}, "a").write("c {{version}}\\n")\n'
+    )
+
+    module = tmp_path / 'watched.py'
+    module.write_text(source.format(version=1))
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    from watched import b, c
+
+    graph = watch.snapshot(b, c)
+    scheduler, jobs = schedulers._prepare(b, c)
+
+    async def main():
+        task = asyncio.ensure_future(watch.watch(scheduler, graph, jobs, period=0.05))
+
+        await asyncio.sleep(0.5)
+        module.write_text(source.format(version=22))
+        await asyncio.sleep(0.5)
+
+        task.cancel()
+
+    with pytest.warns(UserWarning):
+        asyncio.run(main())
+
+    assert log.read_text().splitlines() == ['c 1', 'c 22']
+
+
+def test_slurm_submission(tmp_path, monkeypatch):
+    bindir = tmp_path / 'bin'
+    bindir.mkdir()
+
+    sbatch = bindir / 'sbatch'
+    sbatch.write_text(
+        f'#!{sys.executable}\n'
+        'import pathlib, sys\n'
+        f'root = pathlib.Path({str(tmp_path / "submitted")!r})\n'
+        'root.mkdir(exist_ok=True)\n'
+        'jobid = 100 + len(list(root.iterdir()))\n'
+        '(root / str(jobid)).write_text(sys.stdin.read())\n'
+        'print(jobid)\n'
+    )
+    sbatch.chmod(0o755)
+
+    monkeypatch.setenv('PATH', os.pathsep.join((str(bindir), os.environ['PATH'])))
+
+    @job(array=4, max_running=2)
+    def a(i: int):
+        print('a', i)
+
+    @job
+    def b():
+        print('b')
+
+    @after(a, b)
+    @job
+    def c():
+        print('c')
+
+    jobids = schedule(c, backend='slurm', prune=False, path=tmp_path / 'dawgz', shell='/bin/sh')
+    scripts = {
+        path.name: path.read_text()
+        for path in (tmp_path / 'submitted').iterdir()
+    }
+
+    assert jobids == ['102']
+    assert sorted(scripts) == ['100', '101', '102']
+
+    a_id, b_id = ('100', '101') if '--job-name=a' in scripts['100'] else ('101', '100')
+
+    assert '#SBATCH --array=0-3:1%2\n' in scripts[a_id]
+    assert '--array' not in scripts[b_id]
+    assert f'#SBATCH --dependency=afterok:{a_id},afterok:{b_id}\n' in scripts['102']
+
+    # Each job loads its own function from the payloads pack
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), SLURM_ARRAY_TASK_ID='3')
+    outputs = {}
+
+    for jobid, script in scripts.items():
+        command = script.strip().splitlines()[-1]
+
+        assert command.startswith('python -m awflow.worker "') and '@' in command
+
+        command = command.replace('python', sys.executable, 1)
+        outputs[jobid] = subprocess.run(command, shell=True, env=env, capture_output=True, text=True, check=True).stdout
+
+    assert outputs == {a_id: 'a 3\n', b_id: 'b\n', '102': 'c\n'}